@@ -8,7 +8,7 @@ from falcon import HTTP_400, HTTP_500
 
 from klaxer.rules import Rules
 from klaxer.errors import AuthorizationError, NoRouteFoundError, ServiceNotDefinedError
-from klaxer.lib import classify, enrich, filtered, route, send, validate
+from klaxer.lib import send, validate
 from klaxer.models import Alert
 from klaxer.users import create_user, add_message, bootstrap, api_key_authentication, is_existing_user
 
@@ -21,19 +21,18 @@ RULES = Rules()
 def incoming(service_name: hug.types.text, token: hug.types.text, response, debug=False, body=None):
     """An incoming alert. The core API method"""
     try:
+        # Rules are keyed by lowercased service name
+        service_name = service_name.lower()
         validate(service_name, token)
         alert = Alert.from_service(service_name, body)
-        alert = classify(alert, RULES.get_classification_rules(service_name))
-        # Filter based on rules (e.g. junk an alert if a string is in the body or if it came from a CI bot).
-        if filtered(alert, RULES.get_exclusion_rules(service_name)):
+        # Filter based on rules (e.g. junk an alert if a string is in the body or if it came
+        # from a CI bot), then classify, filter based on user interactions (e.g. bail if we've
+        # snoozed the notification type), enrich based on custom rules (e.g. all alerts with
+        # 'keepalive' have '@deborah' appended to them so Deborah gets an extra level of
+        # notification priority) and determine where the message goes.
+        alert = RULES.apply(alert, service_name, CURRENT_FILTERS)
+        if alert is None:
             return
-        #Filtered based on user interactions (e.g. bail if we've snoozed the notification type snoozed).
-        if filtered(alert, CURRENT_FILTERS):
-            return
-        #Enriched based on custom rules (e.g. all alerts with 'keepalive' have '@deborah' appended to them so Deborah gets an extra level of notification priority.
-        alert = enrich(alert, RULES.get_enrichment_rules(service_name))
-        # Determine where the message goes
-        alert = route(alert, RULES.get_routing_rules(service_name))
 
         # Present relevant debug info without actually sending the Alert
         if debug:
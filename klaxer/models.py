@@ -4,6 +4,9 @@ from enum import IntEnum
 
 TRANSFORMERS = {}
 
+# Alert fields that rules match against case-insensitively
+LOWERED_FIELDS = ('message', 'title')
+
 def transformer(name):
     """Decorator for transforms."""
     def decorator(func):
@@ -12,9 +15,28 @@ def transformer(name):
         return func
     return decorator
 
+def lowered_field(name):
+    """Build a property for an Alert field that also keeps a lowercased copy of
+    it in `<name>_lower`, so that it is computed once per change rather than
+    once per rule"""
+    private = f'_{name}'
+    lowered = f'{name}_lower'
+
+    def getter(self):
+        return getattr(self, private)
+
+    def setter(self, value):
+        setattr(self, private, value)
+        setattr(self, lowered, value.lower() if value is not None else None)
+
+    return property(getter, setter)
+
 class Alert:
     """An alert. Duh."""
 
+    message = lowered_field('message')
+    title = lowered_field('title')
+
     def __init__(self, service, *, title, message, timestamp, target, username, icon_emoji, icon_url):
         self.count = 0
         self.service = service
@@ -1,26 +1,311 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+
 import yaml
-from klaxer.models import Severity
-from klaxer.errors import ServiceNotDefinedError, ConfigurationError
+from klaxer.models import LOWERED_FIELDS, Severity
+from klaxer.errors import ServiceNotDefinedError, ConfigurationError, NoRouteFoundError
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# TODO: Absolute path? Where should this live?
+CONFIG_PATH = 'config/klaxer.yml'
+
+# Parsed configs, keyed by (path, mtime) so edits to the file are picked up.
+# Only the latest parse of each path is kept
+_CONFIG_CACHE = {}
+
+# Above this many keywords a field is classified with an automaton rather
+# than a generated chain of substring tests
+_INLINE_KEYWORD_LIMIT = 16
+
+
+def _cache_config(key, config):
+    """Cache a parsed config, dropping any earlier parse of the same path
+
+    :param key: The (path, mtime) the config was parsed from
+    :param config: The parsed config
+    :returns: dict - The parsed config
+    """
+    for stale in [k for k in _CONFIG_CACHE if k[0] == key[0]]:
+        del _CONFIG_CACHE[stale]
+    _CONFIG_CACHE[key] = config
+    return config
+
+
+def _load_config(path):
+    """Load and parse the YAML config at a path, reusing the previously parsed
+    config if the file hasn't been modified since. Parsed configs are also
+    saved to a JSON sidecar file so that later processes can skip YAML parsing
+
+    :param path: The path to the YAML config
+    :returns: dict - The parsed config
+    """
+    mtime = os.stat(path).st_mtime_ns
+    key = (path, mtime)
+    if key in _CONFIG_CACHE:
+        return _CONFIG_CACHE[key]
+
+    with open(path, 'rb') as ymlfile:
+        raw = ymlfile.read()
+    # mtimes alone can't be trusted (coarse timestamps, copies preserving
+    # them), so the sidecar must also match the YAML's contents
+    digest = hashlib.blake2b(raw).hexdigest()
+
+    cache_path = f'{path}.cache'
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as cachefile:
+            cached = json.load(cachefile)
+        if cached['mtime'] == mtime and cached['digest'] == digest:
+            return _cache_config(key, cached['config'])
+    except (OSError, ValueError, KeyError, TypeError):
+        # Missing, stale or corrupt caches are rebuilt below
+        pass
+
+    try:
+        # libyaml decodes UTF-8 itself, so hand it the raw bytes
+        config = yaml.load(raw, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    except yaml.YAMLError as ye:
+        raise ConfigurationError('failed to parse config') from ye
+
+    try:
+        encoded = json.dumps({'mtime': mtime, 'digest': digest, 'config': config})
+        # Only cache configs that survive the round trip (e.g. no dates or
+        # non-string keys), so the sidecar never changes what Rules sees
+        if json.loads(encoded)['config'] == config:
+            with open(cache_path, 'w', encoding='utf-8') as cachefile:
+                cachefile.write(encoded)
+    except (TypeError, ValueError):
+        pass
+    except OSError:
+        # Expected on read-only deployments, which simply parse on each start
+        logging.debug('Could not write the config cache to %s', cache_path)
+
+    return _cache_config(key, config)
+
+
+class _PatternMatcher:
+    """Stands in for an Aho-Corasick automaton when pyahocorasick isn't
+    installed. Needles sharing a value are compiled into a single regex
+    alternation, so each value costs one C-level scan of the haystack rather
+    than a Python-level substring test per needle"""
+    __slots__ = ('_patterns',)
+
+    def __init__(self, needles):
+        grouped = {}
+        for needle, value in needles.items():
+            grouped.setdefault(value, []).append(needle)
+        self._patterns = tuple((re.compile('|'.join(map(re.escape, group))), value)
+                               for value, group in grouped.items())
+
+    def iter(self, haystack):
+        """Yield (end index, value) for each value with a needle in the haystack"""
+        for pattern, value in self._patterns:
+            match = pattern.search(haystack)
+            if match:
+                yield match.end() - 1, value
+
+
+def _build_automaton(needles):
+    """Compile a set of lowercased needles into an Aho-Corasick automaton so
+    that every needle can be located in a single pass over the haystack. Falls
+    back to regex alternations if pyahocorasick isn't installed
+
+    :param needles: A dict mapping each needle to the value yielded on a match
+    :returns: Automaton - or None if there are no needles to match
+    """
+    if not needles:
+        return None
+    if ahocorasick is None:
+        return _PatternMatcher(needles)
+    automaton = ahocorasick.Automaton()
+    for needle, value in needles.items():
+        automaton.add_word(needle, value)
+    automaton.make_automaton()
+    return automaton
+
+
+def _classification_keywords(cfg):
+    """Collect the classification keywords for a service field
+
+    :param cfg: The service configuration for the source field
+    :returns: dict - Each lowercased keyword mapped to its Severity
+    """
+    # A keyword listed under several severities resolves to the highest one
+    keywords = {}
+    for severity in (Severity.OK, Severity.WARNING, Severity.CRITICAL):
+        for keyword in cfg.get('classification', {}).get(severity.name, []):
+            keywords[keyword.lower()] = severity
+    return keywords
+
+
+def _compile_classifier(source, keywords):
+    """Generate a classifier for a source field with its keywords inlined as
+    constants, so that classifying an alert is a straight run of substring
+    tests with no closure or generator overhead
+
+    :param source: The source field from the Alert object that will be used
+    :param keywords: A dict mapping each lowercased keyword to its Severity
+    :returns: function - The classifier
+    """
+    lines = ['def classify(x):', f'    m = x.{source}_lower']
+    for severity in (Severity.CRITICAL, Severity.WARNING, Severity.OK):
+        needles = [keyword for keyword, sev in keywords.items() if sev is severity]
+        if needles:
+            lines.append('    if ' + ' or '.join(f'{needle!r} in m' for needle in needles) + ':')
+            lines.append(f'        return {severity.name}')
+    lines.append('    return UNKNOWN')
+
+    namespace = {severity.name: severity for severity in Severity}
+    # Keywords are inlined via repr(), so the generated source can't be injected into
+    code = compile('\n'.join(lines), f'<rules:{source}>', 'exec')
+    exec(code, namespace)  # pylint: disable=exec-used
+    return namespace['classify']
+
+
+def _compile_template(template):
+    """Compile an enrichment template into a function rendering it for a field.
+    Templates with a single positional placeholder are split once up front so
+    that rendering is a plain concatenation; anything else falls back to
+    str.format
+
+    :param template: The THEN template
+    :returns: function - Renders the template around the given text
+    """
+    for placeholder in ('{}', '{0}'):
+        if template.count(placeholder) == 1:
+            prefix, suffix = template.split(placeholder)
+            if not any(brace in prefix + suffix for brace in '{}'):
+                return lambda text, pre=prefix, post=suffix: pre + text + post
+    return template.format
+
+
+def _config_digest(cfg):
+    """Digest a service config section so that identical sections can share
+    their built rule sets
+
+    :param cfg: The service configuration for a source field
+    :returns: bytes - The digest
+    """
+    return hashlib.blake2b(repr(sorted(cfg.items())).encode()).digest()
+
+
+def _combine_classification_rules(rules):
+    """Fold the per-field classification rules of a service into a single rule
+    returning the highest severity
+
+    :param rules: The classification rules for each source field, or None if undefined
+    :returns: function - The combined rule
+    """
+    # Fields without keywords can only ever be UNKNOWN, so skip calling them
+    rules = tuple(rule for rule in rules if rule is not None)
+    if not rules:
+        return lambda x: Severity.UNKNOWN
+    if len(rules) == 1:
+        return rules[0]
+
+    def classify(alert):
+        severity = Severity.UNKNOWN
+        for rule in rules:
+            sev = rule(alert)
+            if sev is Severity.CRITICAL:
+                return sev
+            if sev > severity:
+                severity = sev
+        return severity
+    return classify
+
+
+def _combine_exclusion_rules(rules):
+    """Fold the per-field exclusion rules of a service into a single rule
+
+    :param rules: The exclusion rules for each source field, or None if undefined
+    :returns: function - The combined rule, returning True if any rule matched
+    """
+    rules = tuple(rule for rule in rules if rule is not None)
+    if not rules:
+        return lambda x: False
+    if len(rules) == 1:
+        return rules[0]
+    return lambda x: any(rule(x) for rule in rules)
+
+
+def _combine_enrichment_rules(rules):
+    """Fold the per-field enrichment rules of a service into a single rule
+
+    :param rules: The enrichment rules for each source field, or None if undefined
+    :returns: function - The combined rule, returning the merged field updates
+    """
+    rules = tuple(rule for rule in rules if rule is not None)
+    if not rules:
+        return lambda x: None
+    if len(rules) == 1:
+        return rules[0]
+
+    def enrich(alert):
+        updates = {}
+        for rule in rules:
+            updates.update(rule(alert) or {})
+        return updates or None
+    return enrich
+
+
+def _combine_routing_rules(rules):
+    """Fold the per-field routing rules of a service into a single rule
+
+    :param rules: The routing rules for each source field, or None if undefined
+    :returns: function - The combined rule, returning the first matching target
+    """
+    rules = tuple(rule for rule in rules if rule is not None)
+    if not rules:
+        return lambda x: None
+    if len(rules) == 1:
+        return rules[0]
+    return lambda x: next((target for target in (rule(x) for rule in rules) if target), None)
+
+
+class _ServiceRules:
+    """The compiled classification, exclusion, enrichment and routing rules
+    for a single service"""
+    __slots__ = ('classify', 'exclude', 'enrich', 'route', 'batch_patterns')
+
+    def __init__(self, classify, exclude, enrich, route):
+        self.classify = classify
+        self.exclude = exclude
+        self.enrich = enrich
+        self.route = route
+        # Only built once classify_batch is first used for the service
+        self.batch_patterns = None
 
 
 class Rules:
+    __slots__ = ('_config', '_services')
+
+    # Built rules, shared across instances and keyed by (source, digest). They
+    # are dropped whenever a different config is loaded
+    _CACHED_CONFIG_DIGEST = None
+    _CLASSIFICATION_CACHE = {}
+    _EXCLUSION_CACHE = {}
+    _ENRICHMENT_CACHE = {}
+    _ROUTING_CACHE = {}
+    _BATCH_CACHE = {}
+
     def __init__(self):
-        self._classification_rules = {}
-        self._exclusion_rules = {}
-        self._enrichment_rules = {}
-        self._routing_rules = {}
-        self._config = None
-
-        try:
-            # TODO: Absolute path? Where should this live?
-            with open('config/klaxer.yml', 'r') as ymlfile:
-                self._config = yaml.load(ymlfile)
-        except yaml.YAMLError as ye:
-            raise ConfigurationError('failed to parse config') from ye
+        self._services = {}
+        # Service names are case-insensitive, so normalize them once here rather
+        # than on every lookup. Subsequent definitions of the same service will
+        # overwrite the previous ones. Sections are copied since _build_rules
+        # fills them in, and the parsed config is shared with later instances
+        self._config = {service.lower(): dict(cfg) for service, cfg in _load_config(CONFIG_PATH).items()}
+        self._reset_rule_caches(_config_digest(self._config))
 
         for section in self._config:
-            # Subsequent definitions of the same service will overwrite the
-            # previous ones.
             self._build_rules(section)
 
     def _build_rules(self, service):
@@ -30,191 +315,362 @@ class Rules:
         :param service: The service for which rule sets will be generated
         :returns: None
         """
-        if 'message' not in self._config[service]:
-            self._config[service]['message'] = {}
-
-        if 'title' not in self._config[service]:
-            self._config[service]['title'] = {}
-
-        self._classification_rules[service] = []
-        self._exclusion_rules[service] = []
-        self._enrichment_rules[service] = []
-        self._routing_rules[service] = []
-
-        self._build_classification_rules(service, 'message')
-        self._build_classification_rules(service, 'title')
-
-        self._build_exclusion_rules(service, 'message')
-        self._build_exclusion_rules(service, 'title')
-
-        self._build_enrichment_rules(service, 'message')
-        self._build_enrichment_rules(service, 'title')
-
-        self._build_routing_rules(service, 'message')
-        self._build_routing_rules(service, 'title')
-
-        # Ensure that required rule sets are defined
-        if not self._classification_rules:
-            raise ConfigurationError(f'classification rules not defined for {service}')
+        # Rules match against the Alert fields that keep a lowercased copy
+        sources = LOWERED_FIELDS
+        for source in sources:
+            if source not in self._config[service]:
+                self._config[service][source] = {}
+
+        self._services[service] = _ServiceRules(
+            classify=_combine_classification_rules([
+                self._get_or_build_rule(
+                    self._CLASSIFICATION_CACHE, self._build_classification_rules, service, source)
+                for source in sources
+            ]),
+            exclude=_combine_exclusion_rules([
+                self._get_or_build_rule(
+                    self._EXCLUSION_CACHE, self._build_exclusion_rules, service, source)
+                for source in sources
+            ]),
+            enrich=_combine_enrichment_rules([
+                self._get_or_build_rule(
+                    self._ENRICHMENT_CACHE, self._build_enrichment_rules, service, source)
+                for source in sources
+            ]),
+            route=_combine_routing_rules([
+                self._get_or_build_rule(
+                    self._ROUTING_CACHE, self._build_routing_rules, service, source)
+                for source in sources
+            ]),
+        )
 
-        if not self._routing_rules:
-            raise ConfigurationError(f'routes not defined for {service}')
+    @classmethod
+    def _reset_rule_caches(cls, digest):
+        """Drop the built rules if they were built for a different config, so
+        that the caches don't grow with every edit to it
 
-    def _classify(self, alert, source, cfg):
+        :param digest: The digest of the config being loaded
+        :returns: None
+        """
+        if digest == cls._CACHED_CONFIG_DIGEST:
+            return
+        for cache in (cls._CLASSIFICATION_CACHE, cls._EXCLUSION_CACHE, cls._ENRICHMENT_CACHE,
+                      cls._ROUTING_CACHE, cls._BATCH_CACHE):
+            cache.clear()
+        cls._CACHED_CONFIG_DIGEST = digest
+
+    def _get_or_build_rule(self, cache, builder, service, source):
+        """Look up a previously built rule for a service's config, building
+        and caching it on a miss
+
+        :param cache: The class-level cache for the rule family
+        :param builder: The builder for the rule family
+        :param service: The service for which rules will be generated
+        :param source: The source field from the Alert object that will be used
+        :returns: function - The rule, or None if no rule is defined
+        """
+        cfg = self._config[service][source]
+        key = (source, _config_digest(cfg))
+        if key not in cache:
+            try:
+                cache[key] = builder(source, cfg)
+            except ConfigurationError as ce:
+                raise ConfigurationError(f'{ce} for {service}') from ce
+        return cache[key]
+
+    @staticmethod
+    def _classify(alert, lowered, automaton):
         """Return the classification level for an alert given the defined config
 
         :param alert: The alert object to be classified
-        :param source: The source field from the Alert object that will be used
-        :param cfg: The service configuration for the type of Alert being classified
+        :param lowered: The lowercased source field from the Alert object that will be used
+        :param automaton: An automaton mapping keywords to their Severity
         :returns: IntEnum - Severity object
         """
-        if any(crit in getattr(alert, source).lower() for crit in
-               cfg['classification'].get('CRITICAL', [])):
-            return Severity.CRITICAL
-        elif any(warn in getattr(alert, source).lower() for warn in
-                 cfg['classification'].get('WARNING', [])):
-            return Severity.WARNING
-        elif any(ok in getattr(alert, source).lower() for ok in
-                 cfg['classification'].get('OK', [])):
-            return Severity.OK
-
-        return Severity.UNKNOWN
+        severity = Severity.UNKNOWN
+        for _, sev in automaton.iter(getattr(alert, lowered)):
+            # Nothing outranks CRITICAL, so stop scanning as soon as one is seen
+            if sev is Severity.CRITICAL:
+                return sev
+            if sev > severity:
+                severity = sev
+        return severity
+
+    @staticmethod
+    def _enrich(alert, source, lowered, automaton, enrichments):
+        """Return the enriched field for an alert given the defined config.
+        Each enrichment is checked against the text left by the ones before it,
+        so the automaton is only used to find the first enrichment that applies
+
+        :param alert: The alert object to be enriched
+        :param source: The source field from the Alert object that will be used
+        :param lowered: The lowercased counterpart of the source field
+        :param automaton: An automaton mapping each IF needle to the index of
+            the first enrichment using it
+        :param enrichments: The (IF needle, compiled THEN template) pairs, in
+            definition order
+        :returns: dict - The updated field, or None if nothing matched
+        """
+        text = getattr(alert, lowered)
+        first = min((i for _, i in automaton.iter(text)), default=None)
+        if first is None:
+            return None
+        updated = getattr(alert, source)
+        for needle, render in enrichments[first:]:
+            if needle in text:
+                updated = render(updated)
+                text = updated.lower()
+        return {source: updated}
+
+    @staticmethod
+    def _route(alert, lowered, automaton):
+        """Return the routing target for an alert given the defined config
+
+        :param alert: The alert object to be routed
+        :param lowered: The lowercased source field from the Alert object that will be used
+        :param automaton: An automaton mapping each IF needle to the
+            (definition index, THEN target) of the first route it triggers
+        :returns: str - The first matching target, or None if nothing matched
+        """
+        first = min((payload for _, payload in automaton.iter(getattr(alert, lowered))), default=None)
+        return None if first is None else first[1]
 
-    def _build_classification_rules(self, service, source):
-        """Build the classification rule set for a service
+    @staticmethod
+    def _build_classification_rules(source, cfg):
+        """Build the classification rule for a service field
 
-        :param service: The service for which rule sets will be generated
         :param source: The source field from the Alert object that will be used
-        :returns: None
+        :param cfg: The service configuration for the source field
+        :returns: function - The rule, or None if no keywords are defined
         """
-        service = service.lower()
-        cfg = self._config[service][source]
+        keywords = _classification_keywords(cfg)
+        if not keywords:
+            return None
 
-        # Default to returning UNKNOWN severity
-        if 'classification' not in cfg:
-            self._classification_rules[service].append(lambda x: Severity.UNKNOWN)
-            return
+        if len(keywords) <= _INLINE_KEYWORD_LIMIT:
+            return _compile_classifier(source, keywords)
 
-        self._classification_rules[service].append(lambda x, src=source, cfg=cfg:
-                                                   self._classify(x, src, cfg))
+        automaton = _build_automaton(keywords)
+        return lambda x, lowered=f'{source}_lower', a=automaton: Rules._classify(x, lowered, a)
 
-    def _build_exclusion_rules(self, service, source):
-        """Build the exclusion rule set for a service
+    @staticmethod
+    def _build_batch_patterns(_source, cfg):
+        """Build the patterns used to classify batches of a service field, one
+        alternation of every keyword per severity, highest severity first
 
-        :param service: The service for which rule sets will be generated
-        :returns: None
+        :param _source: Unused, as patterns match the text passed in rather
+            than an Alert field
+        :param cfg: The service configuration for the source field
+        :returns: tuple - (Severity, compiled pattern) pairs
         """
-        service = service.lower()
-        cfg = self._config[service][source]
+        keywords = _classification_keywords(cfg)
+        patterns = []
+        for severity in (Severity.CRITICAL, Severity.WARNING, Severity.OK):
+            needles = [keyword for keyword, sev in keywords.items() if sev is severity]
+            if needles:
+                patterns.append((severity, re.compile('|'.join(map(re.escape, needles)))))
+        return tuple(patterns)
+
+    @staticmethod
+    def _build_exclusion_rules(source, cfg):
+        """Build the exclusion rule for a service field
 
+        :param source: The source field from the Alert object that will be used
+        :param cfg: The service configuration for the source field
+        :returns: function - The rule, or None if no rule is defined
+        """
         if 'exclude' not in cfg:
-            return
+            return None
 
-        self._exclusion_rules[service].append(
-            lambda x, cfg=cfg: any(ignore in getattr(x, source).lower() for ignore in cfg['exclude'])
-        )
+        automaton = _build_automaton({i.lower(): True for i in cfg['exclude']})
+        if automaton is None:
+            return None
 
-    def _build_enrichment_rules(self, service, source):
-        """Build the enrichment rule set for a service
+        lowered = f'{source}_lower'
 
-        :param service: The service for which rule sets will be generated
-        :returns: None
-        """
-        service = service.lower()
-        cfg = self._config[service][source]
+        def exclude(alert):
+            return next(automaton.iter(getattr(alert, lowered)), None) is not None
+        return exclude
+
+    @staticmethod
+    def _build_enrichment_rules(source, cfg):
+        """Build the enrichment rule for a service field
 
+        :param source: The source field from the Alert object that will be used
+        :param cfg: The service configuration for the source field
+        :returns: function - The rule, or None if no rule is defined
+        """
         if 'enrichments' not in cfg:
-            return
+            return None
 
         if isinstance(cfg['enrichments'], str):
-            self._enrichment_rules[service].append(
-                lambda x, cfg=cfg: {source: cfg['enrichments'].format(getattr(x, source))}
-            )
+            render = _compile_template(cfg['enrichments'])
+
+            def enrich(alert):
+                return {source: render(getattr(alert, source))}
+            return enrich
         elif isinstance(cfg['enrichments'], list):
-            for e in cfg['enrichments']:
-                self._enrichment_rules[service].append(
-                    lambda x, e=e: {source: e['THEN'].format(getattr(x, source))} if e['IF'].lower() in getattr(x, source).lower() else None
-                )
+            enrichments = tuple((e['IF'].lower(), _compile_template(e['THEN'])) for e in cfg['enrichments'])
+            # Unlike routes, enrichments can't be keyed on their payloads:
+            # each one sees the text left by those before it, so the automaton
+            # only finds where the cascade starts
+            first_uses = {}
+            for i, (needle, _) in enumerate(enrichments):
+                first_uses.setdefault(needle, i)
+            automaton = _build_automaton(first_uses)
+            if automaton is None:
+                return None
+
+            lowered = f'{source}_lower'
+
+            def enrich(alert):
+                return Rules._enrich(alert, source, lowered, automaton, enrichments)
+            return enrich
         else:
-            raise ConfigurationError(f'Invalid enrichments definition for {service}')
+            raise ConfigurationError('Invalid enrichments definition')
 
-    def _build_routing_rules(self, service, source):
-        """Build the routing rule set for a service
+    @staticmethod
+    def _build_routing_rules(source, cfg):
+        """Build the routing rule for a service field
 
-        :param service: The service for which rule sets will be generated
-        :returns: None
+        :param source: The source field from the Alert object that will be used
+        :param cfg: The service configuration for the source field
+        :returns: function - The rule, or None if no rule is defined
         """
-        service = service.lower()
-        cfg = self._config[service][source]
-
         if 'routes' not in cfg:
-            return
+            return None
 
         if isinstance(cfg['routes'], str):
-            self._routing_rules[service].append(
-                lambda x, cfg=cfg: cfg['routes']
-            )
+            return lambda x, cfg=cfg: cfg['routes']
         elif isinstance(cfg['routes'], list):
-            for r in cfg['routes']:
-                self._routing_rules[service].append(
-                    lambda x, r=r: r['THEN'] if r['IF'].lower() in getattr(x, source).lower() else None
-                )
+            # Only the first route for a needle can ever be picked
+            payloads = {}
+            for i, r in enumerate(cfg['routes']):
+                payloads.setdefault(r['IF'].lower(), (i, r['THEN']))
+            automaton = _build_automaton(payloads)
+            if automaton is None:
+                return None
+
+            return lambda x, lowered=f'{source}_lower', a=automaton: Rules._route(x, lowered, a)
         else:
-            raise ConfigurationError(f'invalid routes definition for {service}')
+            raise ConfigurationError('invalid routes definition')
+
+    def _get_service_rules(self, service):
+        """Get the compiled rules for a service
+
+        :param service: The lowercased name of the service
+        :returns: _ServiceRules - The service's rules
+        """
+        rules = self._services.get(service)
+        if rules is None:
+            raise ServiceNotDefinedError(service)
+        return rules
+
+    def apply(self, alert, service, filters=()):
+        """Run an alert through the rules for a service. Exclusion rules are
+        checked first so that excluded alerts skip classification, enrichment
+        and routing altogether
+
+        :param alert: The alert to which rules should be applied
+        :param service: The lowercased name of the service
+        :param filters: Additional exclusion rules (e.g. user snoozes) to check
+            once the alert has been classified
+        :returns: Alert - The classified, enriched and routed Alert object, or
+            None if the alert should be dropped
+        """
+        rules = self._get_service_rules(service)
+
+        if rules.exclude(alert):
+            return None
+
+        alert.severity = rules.classify(alert)
+        if any(rule(alert) for rule in filters):
+            return None
+
+        updates = rules.enrich(alert)
+        if updates:
+            for name, value in updates.items():
+                alert[name] = value
+
+        target = rules.route(alert)
+        if not target:
+            raise NoRouteFoundError()
+        alert.target = target
+
+        return alert
+
+    def classify_batch(self, messages, service):
+        """Classify a batch of alert messages for a service at once. The
+        messages are joined so that each severity's keywords are found with a
+        single regex scan over the whole batch, rather than one per message.
+        Only the message classification rules are applied, so for services
+        that also classify on title the results can differ from
+        get_classification_rules
+
+        :param messages: The alert messages to classify
+        :param service: The lowercased name of the service
+        :returns: list - The Severity of each message, in order
+        """
+        rules = self._get_service_rules(service)
+        if rules.batch_patterns is None:
+            rules.batch_patterns = self._get_or_build_rule(
+                self._BATCH_CACHE, self._build_batch_patterns, service, 'message')
+        patterns = rules.batch_patterns
+
+        severities = [Severity.UNKNOWN] * len(messages)
+        if not patterns or not messages:
+            return severities
+
+        # Offsets of each message within the joined batch; the NUL separator
+        # keeps keywords from matching across message boundaries
+        lowered = [message.lower() for message in messages]
+        starts = []
+        offset = 0
+        for message in lowered:
+            starts.append(offset)
+            offset += len(message) + 1
+        batch = '\0'.join(lowered)
+
+        for severity, pattern in patterns:
+            for match in pattern.finditer(batch):
+                row = bisect.bisect_right(starts, match.start()) - 1
+                if severities[row] < severity:
+                    severities[row] = severity
+        return severities
 
     def get_classification_rules(self, service):
-        """Get the classification rule set for a service. This rule set will be
-        a list of lambda functions which will take in the Alert object to which
-        rules should be applied
+        """Get the classification rule for a service. This is a single function
+        which will take in the Alert object to which rules should be applied
 
-        :param service: The name of the service
-        :returns: None
+        :param service: The lowercased name of the service
+        :returns: function - The rule
         """
-        try:
-            service = service.lower()
-            return self._classification_rules[service]
-        except KeyError as ke:
-            raise ServiceNotDefinedError(str(ke))
+        return self._get_service_rules(service).classify
 
     def get_exclusion_rules(self, service):
-        """Get the exclusion rule set for a service. This rule set will be
-        a list of lambda functions which will take in the Alert object to which
-        rules should be applied
+        """Get the exclusion rule for a service. This is a single function
+        which will take in the Alert object to which rules should be applied
 
-        :param service: The name of the service
-        :returns: None
+        :param service: The lowercased name of the service
+        :returns: function - The rule
         """
-        try:
-            service = service.lower()
-            return self._exclusion_rules[service]
-        except KeyError as ke:
-            raise ServiceNotDefinedError(str(ke))
+        return self._get_service_rules(service).exclude
 
     def get_enrichment_rules(self, service):
-        """Get the enrichment rule set for a service. This rule set will be
-        a list of lambda functions which will take in the Alert object to which
-        rules should be applied
+        """Get the enrichment rule for a service. This is a single function
+        which will take in the Alert object to which rules should be applied
 
-        :param service: The name of the service
-        :returns: None
+        :param service: The lowercased name of the service
+        :returns: function - The rule
         """
-        try:
-            service = service.lower()
-            return self._enrichment_rules[service]
-        except KeyError as ke:
-            raise ServiceNotDefinedError(str(ke))
+        return self._get_service_rules(service).enrich
 
     def get_routing_rules(self, service):
-        """Get the routing rule set for a service. This rule set will be
-        a list of lambda functions which will take in the Alert object to which
-        rules should be applied
+        """Get the routing rule for a service. This is a single function
+        which will take in the Alert object to which rules should be applied
 
-        :param service: The name of the service
-        :returns: None
+        :param service: The lowercased name of the service
+        :returns: function - The rule
         """
-        try:
-            service = service.lower()
-            return self._routing_rules[service]
-        except KeyError as ke:
-            raise ServiceNotDefinedError(str(ke))
+        return self._get_service_rules(service).route
 
@@ -53,5 +53,6 @@ setup(name='klaxer',
       install_requires=REQUIREMENTS,
       extras_require={
           'dev': ['pytest', 'coverage', 'pylint', 'pytest-cov'],
+          'ahocorasick': ['pyahocorasick'],
       },
      )
@@ -0,0 +1,261 @@
+"""Tests for the rules engine"""
+
+import os
+
+import pytest
+import yaml
+
+from klaxer import rules
+from klaxer.errors import ConfigurationError, NoRouteFoundError
+from klaxer.models import Alert, Severity
+
+
+CONFIG = """
+sensu:
+    message:
+        enrichments:
+            - IF: "alpha"
+              THEN: "{} beta"
+            - IF: "beta"
+              THEN: "{} gamma"
+            - IF: "delta"
+              THEN: "replaced"
+            - IF: "alpha"
+              THEN: "{} again"
+        routes: "alerts"
+"""
+
+
+@pytest.fixture(params=[True, False], ids=['ahocorasick', 'regex'])
+def make_rules(request, tmp_path, monkeypatch):
+    """Build rules from a config, with and without pyahocorasick"""
+    if not request.param:
+        monkeypatch.setattr(rules, 'ahocorasick', None)
+    elif rules.ahocorasick is None:
+        pytest.skip('pyahocorasick is not installed')
+    # Start from empty caches so each case builds its own rules
+    monkeypatch.setattr(rules, '_CONFIG_CACHE', {})
+    monkeypatch.setattr(rules.Rules, '_CACHED_CONFIG_DIGEST', None)
+    for cache in ('_CLASSIFICATION_CACHE', '_EXCLUSION_CACHE', '_ENRICHMENT_CACHE', '_ROUTING_CACHE',
+                  '_BATCH_CACHE'):
+        monkeypatch.setattr(rules.Rules, cache, {})
+    (tmp_path / 'config').mkdir()
+    monkeypatch.chdir(tmp_path)
+
+    def make(config):
+        (tmp_path / 'config' / 'klaxer.yml').write_text(config)
+        return rules.Rules()
+    return make
+
+
+@pytest.fixture
+def sensu_rules(make_rules):
+    return make_rules(CONFIG)
+
+
+def make_alert(message, title=''):
+    return Alert('sensu', title=title, message=message, timestamp=None, target=None,
+                 username=None, icon_emoji=None, icon_url=None)
+
+
+@pytest.mark.parametrize('message, expected', [
+    # Each enrichment sees the text left by the ones before it
+    ('alpha', 'alpha beta gamma again'),
+    ('beta', 'beta gamma'),
+    # An enrichment can remove the needle a later one would have matched
+    ('alpha delta', 'replaced'),
+])
+def test_enrichments_cascade(sensu_rules, message, expected):
+    alert = sensu_rules.apply(make_alert(message), 'sensu')
+    assert alert.message == expected
+
+
+def test_unmatched_enrichments_leave_the_alert_alone(sensu_rules):
+    alert = sensu_rules.apply(make_alert('nothing to see'), 'sensu')
+    assert alert.message == 'nothing to see'
+
+
+def test_services_without_routes_still_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(rules, '_CONFIG_CACHE', {})
+    (tmp_path / 'config').mkdir()
+    (tmp_path / 'config' / 'klaxer.yml').write_text('sensu:\n    message:\n        exclude: ["keepalive"]\n')
+    monkeypatch.chdir(tmp_path)
+    # Only the service's own alerts fail, once they can't be routed
+    with pytest.raises(NoRouteFoundError):
+        rules.Rules().apply(make_alert('disk full'), 'sensu')
+
+
+def test_config_sidecar_is_checked_against_the_yaml_contents(tmp_path, monkeypatch):
+    monkeypatch.setattr(rules, '_CONFIG_CACHE', {})
+    path = tmp_path / 'klaxer.yml'
+    path.write_text('sensu:\n    description: "old"\n')
+    assert rules._load_config(str(path))['sensu']['description'] == 'old'
+
+    # Same mtime, different contents: the sidecar must not be served
+    mtime = path.stat().st_mtime_ns
+    path.write_text('sensu:\n    description: "new"\n')
+    os.utime(path, ns=(mtime, mtime))
+    monkeypatch.setattr(rules, '_CONFIG_CACHE', {})
+    assert rules._load_config(str(path))['sensu']['description'] == 'new'
+
+    # Unchanged YAML is loaded from the sidecar without parsing
+    monkeypatch.setattr(rules, '_CONFIG_CACHE', {})
+    monkeypatch.setattr(rules.yaml, 'load', None)
+    assert rules._load_config(str(path))['sensu']['description'] == 'new'
+
+
+BATCH_CONFIG = """
+sensu:
+    message:
+        classification:
+            CRITICAL: ["error", "failed"]
+            WARNING: ["warn"]
+            OK: ["ok"]
+        routes: "alerts"
+    title:
+        classification:
+            CRITICAL: ["down"]
+"""
+
+
+@pytest.mark.parametrize('messages, expected', [
+    ([], []),
+    ([''], [Severity.UNKNOWN]),
+    (['', 'error', ''], [Severity.UNKNOWN, Severity.CRITICAL, Severity.UNKNOWN]),
+    # Keywords at either end of a message, and never across the separator
+    (['error at start', 'ends with warn', 'ok'], [Severity.CRITICAL, Severity.WARNING, Severity.OK]),
+    (['err', 'or', 'fai', 'led'], [Severity.UNKNOWN] * 4),
+    # The highest severity found in a message wins
+    (['ok then warn', 'warn, ok, then failed'], [Severity.WARNING, Severity.CRITICAL]),
+])
+def test_classify_batch(make_rules, messages, expected):
+    assert make_rules(BATCH_CONFIG).classify_batch(messages, 'sensu') == expected
+
+
+def test_classify_batch_agrees_with_classify(make_rules):
+    batch_rules = make_rules(BATCH_CONFIG)
+    classify = batch_rules.get_classification_rules('sensu')
+    # 'İ' grows when lowercased, shifting the offsets of later messages
+    messages = ['İ error', 'WARN', 'İİ ok', 'nothing', 'Ok, Warn', 'FAILED', '']
+    assert batch_rules.classify_batch(messages, 'sensu') == [classify(make_alert(m)) for m in messages]
+
+
+def test_classify_batch_ignores_titles(make_rules):
+    batch_rules = make_rules(BATCH_CONFIG)
+    assert batch_rules.get_classification_rules('sensu')(make_alert('ok', title='down')) is Severity.CRITICAL
+    assert batch_rules.classify_batch(['ok'], 'sensu') == [Severity.OK]
+
+
+@pytest.mark.parametrize('keyword', ["it's", 'say "hi"', 'back\\slash', 'new\nline', "'''", '{}'])
+def test_classifier_keywords_are_inlined_literally(make_rules, keyword):
+    config = yaml.safe_dump({'sensu': {'message': {
+        'classification': {'CRITICAL': [keyword]},
+        'routes': 'alerts',
+    }}})
+    classify = make_rules(config).get_classification_rules('sensu')
+    assert classify(make_alert(f'before {keyword} after')) is Severity.CRITICAL
+    assert classify(make_alert('before after')) is Severity.UNKNOWN
+
+
+def test_classifier_keyword_under_several_severities_takes_the_highest(make_rules):
+    config = yaml.safe_dump({'sensu': {'message': {
+        'classification': {'OK': ['disk'], 'CRITICAL': ['disk'], 'WARNING': ['disk']},
+        'routes': 'alerts',
+    }}})
+    assert make_rules(config).get_classification_rules('sensu')(make_alert('disk')) is Severity.CRITICAL
+
+
+@pytest.mark.parametrize('count', [rules._INLINE_KEYWORD_LIMIT, rules._INLINE_KEYWORD_LIMIT + 1])
+def test_classifiers_either_side_of_the_inline_limit(make_rules, count):
+    warnings = [f'warn{i:02}' for i in range(count - 2)]
+    config = yaml.safe_dump({'sensu': {'message': {
+        'classification': {'CRITICAL': ['error'], 'WARNING': warnings, 'OK': ['"ok"']},
+        'routes': 'alerts',
+    }}})
+    classify = make_rules(config).get_classification_rules('sensu')
+    # Generated classifiers are compiled from source named after the service
+    assert classify.__code__.co_filename.startswith('<rules:') == (count <= rules._INLINE_KEYWORD_LIMIT)
+    assert classify(make_alert(f'{warnings[-1]} error')) is Severity.CRITICAL
+    assert classify(make_alert(f'{warnings[0]} "ok"')) is Severity.WARNING
+    assert classify(make_alert('"OK"')) is Severity.OK
+    assert classify(make_alert('ok')) is Severity.UNKNOWN
+
+
+@pytest.mark.parametrize('template', [
+    '@admin: {}', '{} (@admin)', '{0}!', '[{0}]', '{{}}', '{{}} {}', '{{{}}}', 'no placeholder', '',
+])
+def test_compiled_templates_render_like_format(template):
+    assert rules._compile_template(template)('Disk {full}') == template.format('Disk {full}')
+
+
+def test_compiled_templates_fail_like_format():
+    with pytest.raises(IndexError):
+        '{}{}'.format('text')
+    with pytest.raises(IndexError):
+        rules._compile_template('{}{}')('text')
+
+
+APPLY_CONFIG = """
+sensu:
+    message:
+        classification:
+            CRITICAL: ["error"]
+        exclude: ["keepalive"]
+        routes:
+            - IF: "disk"
+              THEN: "ops"
+"""
+
+
+def test_apply_drops_excluded_alerts_before_classifying(make_rules):
+    alert = make_alert('keepalive error on disk')
+    assert make_rules(APPLY_CONFIG).apply(alert, 'sensu', [lambda x: pytest.fail('filtered')]) is None
+    assert alert.severity is None
+
+
+def test_apply_filters_classified_alerts(make_rules):
+    seen = []
+    filters = [lambda x: seen.append(x.severity), lambda x: x.severity is Severity.CRITICAL]
+    assert make_rules(APPLY_CONFIG).apply(make_alert('error on disk'), 'sensu', filters) is None
+    assert seen == [Severity.CRITICAL]
+
+
+def test_apply_routes_unfiltered_alerts(make_rules):
+    alert = make_rules(APPLY_CONFIG).apply(make_alert('error on disk'), 'sensu', [lambda x: False])
+    assert (alert.severity, alert.target) == (Severity.CRITICAL, 'ops')
+
+
+def test_apply_requires_a_route(make_rules):
+    with pytest.raises(NoRouteFoundError):
+        make_rules(APPLY_CONFIG).apply(make_alert('error on network'), 'sensu')
+
+
+def test_config_cache_keeps_only_the_latest_parse(tmp_path, monkeypatch):
+    monkeypatch.setattr(rules, '_CONFIG_CACHE', {})
+    path = tmp_path / 'klaxer.yml'
+    for i in range(3):
+        path.write_text(f'sensu:\n    description: "{i}"\n')
+        os.utime(path, ns=(i, i))
+        assert rules._load_config(str(path))['sensu']['description'] == str(i)
+    assert list(rules._CONFIG_CACHE) == [(str(path), 2)]
+
+
+def test_rule_caches_are_shared_until_the_config_changes(make_rules):
+    first = make_rules(APPLY_CONFIG)
+    second = rules.Rules()
+    assert second.get_routing_rules('sensu') is first.get_routing_rules('sensu')
+
+    path = os.path.join('config', 'klaxer.yml')
+    mtime = os.stat(path).st_mtime_ns
+    with open(path, 'w') as ymlfile:
+        ymlfile.write(APPLY_CONFIG.replace('keepalive', 'heartbeat'))
+    os.utime(path, ns=(mtime + 1, mtime + 1))
+    changed = rules.Rules()
+    assert changed.get_routing_rules('sensu') is not first.get_routing_rules('sensu')
+    # Only the rules for the message and title of the current config are kept
+    assert len(rules.Rules._ROUTING_CACHE) == 2
+
+
+def test_invalid_definitions_name_their_service(make_rules):
+    with pytest.raises(ConfigurationError, match='invalid routes definition for sensu'):
+        make_rules('sensu:\n    message:\n        routes: 3\n')